@@ -1,14 +1,28 @@
+import concurrent.futures
 import fnmatch
+import functools
 import itertools
 import os
+import re
 import textwrap
 import typing
 from collections.abc import Generator
 from dataclasses import dataclass
 
-import tomlkit
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib  # type: ignore[no-redef]
+
+import tomli_w
 import yaml
 
+try:
+    # libyaml-backed dumper, roughly an order of magnitude faster than the pure-Python one
+    from yaml import CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeDumper as _YamlDumper  # type: ignore[assignment]
+
 from . import _config
 from ._constants import cli_name
 
@@ -17,6 +31,32 @@ __all__ = [
 ]
 
 HEADER = f"# This file is generated by `{cli_name}`."
+_HEADER_BYTES = HEADER.encode()
+
+PRESERVE_TOML_STYLE_ENV_VAR = "RAPIDS_DEPENDENCY_FILE_GENERATOR_PRESERVE_TOML_STYLE"
+"""Environment variable that, when set to a non-empty value, makes ``pyproject.toml``
+updates go through ``tomlkit`` to preserve the file's existing style and comments.
+The default writer is much faster but normalizes formatting."""
+
+
+def _find_generated_file_candidates(root: str) -> Generator[str, None, None]:
+    """Yield paths of files under ``root`` that could have been written by this generator.
+
+    Uses ``os.scandir`` rather than ``os.walk`` so that the file-type checks reuse
+    the information already returned by the directory scan instead of issuing an
+    extra ``stat`` call per entry.
+    """
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        # ignore unreadable or missing directories, like os.walk does
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _find_generated_file_candidates(entry.path)
+            elif entry.name.endswith((".txt", ".yaml")):
+                yield entry.path
 
 
 def delete_existing_files(root: str) -> None:
@@ -30,14 +70,13 @@ def delete_existing_files(root: str) -> None:
     root : str
         The path (relative or absolute) to the root of the directory tree to search for files to delete.
     """
-    for dirpath, _, filenames in os.walk(root):
-        for fn in filter(lambda fn: fn.endswith(".txt") or fn.endswith(".yaml"), filenames):
-            with open(file_path := os.path.join(dirpath, fn)) as f:
-                try:
-                    if HEADER in f.read():
-                        os.remove(file_path)
-                except UnicodeDecodeError:
-                    pass
+    for file_path in _find_generated_file_candidates(root):
+        # Generated files carry the header on their first line, so only that line
+        # needs to be read. Reading bytes also sidesteps UnicodeDecodeError for
+        # unrelated binary files that happen to match the extensions.
+        with open(file_path, "rb") as f:
+            if f.readline().startswith(_HEADER_BYTES):
+                os.remove(file_path)
 
 
 def dedupe(
@@ -55,12 +94,12 @@ def dedupe(
     Sequence[str | dict[str, list[str]]]
         The ``dependencies`` with all duplicates removed.
     """
-    string_deps: set[str] = set()
+    # Partition by type in two passes; the set comprehension runs as a single
+    # C-level loop over the common all-string case.
+    string_deps = {dep for dep in dependencies if isinstance(dep, str)}
     pip_deps: set[str] = set()
     for dep in dependencies:
-        if isinstance(dep, str):
-            string_deps.add(dep)
-        elif isinstance(dep, _config.PipRequirements):
+        if isinstance(dep, _config.PipRequirements):
             pip_deps.update(dep.pip)
 
     if pip_deps:
@@ -69,8 +108,8 @@ def dedupe(
         return sorted(string_deps)
 
 
-def grid(gridspec: dict[str, list[str]]) -> Generator[dict[str, str], None, None]:
-    """Yield the Cartesian product of a `dict` of iterables.
+def grid(gridspec: dict[str, list[str]]) -> list[dict[str, str]]:
+    """Compute the Cartesian product of a `dict` of iterables.
 
     The input ``gridspec`` is a dictionary whose keys correspond to
     parameter names. Each key is associated with an iterable of the
@@ -83,14 +122,25 @@ def grid(gridspec: dict[str, list[str]]) -> Generator[dict[str, str], None, None
     gridspec : dict[str, list[str]]
         A mapping from parameter names to lists of parameter values.
 
-    Yields
-    ------
-    dict[str, str]
-        Each yielded value is a dictionary containing one of the unique
+    Returns
+    -------
+    list[dict[str, str]]
+        Each element is a dictionary containing one of the unique
         combinations of parameter values from `gridspec`.
     """
-    for values in itertools.product(*gridspec.values()):
-        yield dict(zip(gridspec.keys(), values))
+    keys = tuple(gridspec)
+    return [dict(zip(keys, values)) for values in itertools.product(*gridspec.values())]
+
+
+@functools.lru_cache(maxsize=None)
+def _file_contents_header(relative_path_to_config_file: str) -> str:
+    """Render the generated-file disclaimer header, once per unique relative path."""
+    return textwrap.dedent(
+        f"""\
+        {HEADER}
+        # To make changes, edit {relative_path_to_config_file} and run `{cli_name}`.
+        """
+    )
 
 
 def make_dependency_file(
@@ -103,6 +153,7 @@ def make_dependency_file(
     conda_channels: list[str],
     dependencies: typing.Sequence[typing.Union[str, dict[str, list[str]]]],
     extras: typing.Union[_config.FileExtras, None],
+    relative_path_to_config_file: typing.Union[str, None] = None,
 ) -> str:
     """Generate the contents of the dependency file.
 
@@ -128,19 +179,18 @@ def make_dependency_file(
         The dependencies to include in the file.
     extras : FileExtras | None
         Any extra information provided for generating this dependency file.
+    relative_path_to_config_file : str | None
+        The path of ``config_file`` relative to ``output_dir``, if the caller has
+        already computed it. If ``None``, it is computed from the two paths.
 
     Returns
     -------
     str
         The contents of the file.
     """
-    relative_path_to_config_file = os.path.relpath(config_file, output_dir)
-    file_contents = textwrap.dedent(
-        f"""\
-        {HEADER}
-        # To make changes, edit {relative_path_to_config_file} and run `{cli_name}`.
-        """
-    )
+    if relative_path_to_config_file is None:
+        relative_path_to_config_file = os.path.relpath(config_file, output_dir)
+    file_contents = _file_contents_header(relative_path_to_config_file)
     if file_type == _config.Output.CONDA:
         env_dict = {
             "channels": conda_channels,
@@ -148,69 +198,191 @@ def make_dependency_file(
         }
         if conda_env_name is not None:
             env_dict["name"] = conda_env_name
-        file_contents += yaml.dump(env_dict)
+        # env_dict is built in sorted key order and dedupe() already sorted the
+        # dependencies, so sort_keys=False skips a redundant sort inside PyYAML
+        file_contents += yaml.dump(env_dict, Dumper=_YamlDumper, sort_keys=False)
     elif file_type == _config.Output.REQUIREMENTS:
+        requirements: list[str] = []
         for dep in dependencies:
             if isinstance(dep, dict):
                 raise ValueError(f"Map inputs like {dep} are not allowed for the 'requirements' file type.")
+            requirements.append(dep)
 
-            file_contents += f"{dep}\n"
+        # build the body with a single join instead of repeated string concatenation,
+        # which copies the accumulated prefix on every iteration
+        if requirements:
+            file_contents += "\n".join(requirements) + "\n"
     elif file_type == _config.Output.PYPROJECT:
-        if extras is None:
-            raise ValueError("The 'extras' field must be provided for the 'pyproject' file type.")
-
-        if extras.table == "build-system":
-            key = "requires"
-            if extras.key is not None:
-                raise ValueError(
-                    "The 'key' field is not allowed for the 'pyproject' file type when 'table' is 'build-system'."
-                )
-        elif extras.table == "project":
-            key = "dependencies"
-            if extras.key is not None:
-                raise ValueError(
-                    "The 'key' field is not allowed for the 'pyproject' file type when 'table' is 'project'."
-                )
-        else:
-            if extras.key is None:
-                raise ValueError(
-                    "The 'key' field is required for the 'pyproject' file type when "
-                    "'table' is not one of 'build-system' or 'project'."
-                )
-            key = extras.key
+        table_name, key = _pyproject_table_key(extras)
+
+        # Resolve the style-preservation flag once so a mid-run environment change
+        # cannot mix the two TOML backends within one update.
+        preserve_style = _preserve_toml_style_requested()
 
         # This file type needs to be modified in place instead of built from scratch.
-        with open(os.path.join(output_dir, file_name)) as f:
-            file_contents_toml = tomlkit.load(f)
+        doc = _load_pyproject(os.path.join(output_dir, file_name), preserve_style=preserve_style)
+        _update_pyproject(
+            doc,
+            table_name=table_name,
+            key=key,
+            dependencies=dependencies,
+            relative_path_to_config_file=relative_path_to_config_file,
+            preserve_style=preserve_style,
+        )
+        file_contents = _dump_pyproject(
+            doc, relative_path_to_config_file=relative_path_to_config_file, preserve_style=preserve_style
+        )
 
-        toml_deps = tomlkit.array()
-        for dep in dependencies:
-            toml_deps.add_line(dep)
-        toml_deps.add_line(indent="")
-        toml_deps.comment(
-            f"This list was generated by `{cli_name}`. To make changes, edit "
-            f"{relative_path_to_config_file} and run `{cli_name}`."
+    return file_contents
+
+
+def _pyproject_table_key(extras: typing.Union[_config.FileExtras, None]) -> tuple[str, str]:
+    """Validate pyproject ``extras`` and return the table name and key to update."""
+    if extras is None:
+        raise ValueError("The 'extras' field must be provided for the 'pyproject' file type.")
+
+    if extras.table == "build-system":
+        key = "requires"
+        if extras.key is not None:
+            raise ValueError(
+                "The 'key' field is not allowed for the 'pyproject' file type when 'table' is 'build-system'."
+            )
+    elif extras.table == "project":
+        key = "dependencies"
+        if extras.key is not None:
+            raise ValueError("The 'key' field is not allowed for the 'pyproject' file type when 'table' is 'project'.")
+    else:
+        if extras.key is None:
+            raise ValueError(
+                "The 'key' field is required for the 'pyproject' file type when "
+                "'table' is not one of 'build-system' or 'project'."
+            )
+        key = extras.key
+
+    return extras.table, key
+
+
+def _preserve_toml_style_requested() -> bool:
+    """Read the style-preservation escape hatch from the environment."""
+    return bool(os.environ.get(PRESERVE_TOML_STYLE_ENV_VAR))
+
+
+def _load_pyproject(path: typing.Union[str, os.PathLike], *, preserve_style: bool):
+    """Parse an existing ``pyproject.toml`` file."""
+    if preserve_style:
+        import tomlkit
+
+        with open(path) as f:
+            return tomlkit.load(f)
+
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def _update_pyproject(
+    doc,
+    *,
+    table_name: str,
+    key: str,
+    dependencies: typing.Sequence[typing.Union[str, dict[str, list[str]]]],
+    relative_path_to_config_file: str,
+    preserve_style: bool,
+) -> None:
+    """Set a dependency list in a parsed ``pyproject.toml`` document, in place."""
+    if preserve_style:
+        _update_pyproject_tomlkit(
+            doc,
+            table_name=table_name,
+            key=key,
+            dependencies=dependencies,
+            relative_path_to_config_file=relative_path_to_config_file,
         )
+        return
 
-        # Recursively descend into subtables like "[x.y.z]", creating tables as needed.
-        table = file_contents_toml
-        for section in extras.table.split("."):
-            try:
-                table = table[section]
-            except tomlkit.exceptions.NonExistentKey:
-                # If table is not a super-table (i.e. if it has its own contents and is
-                # not simply parted of a nested table name 'x.y.z') add a new line
-                # before adding a new sub-table.
-                if not table.is_super_table():
-                    table.add(tomlkit.nl())
-                table[section] = tomlkit.table()
-                table = table[section]
+    # Recursively descend into subtables like "[x.y.z]", creating tables as needed.
+    table = doc
+    for section in table_name.split("."):
+        table = table.setdefault(section, {})
 
-        table[key] = toml_deps
+    table[key] = list(dependencies)
 
-        file_contents = tomlkit.dumps(file_contents_toml)
 
-    return file_contents
+def _dump_pyproject(doc, *, relative_path_to_config_file: str, preserve_style: bool) -> str:
+    """Serialize a parsed ``pyproject.toml`` document back to a string."""
+    if preserve_style:
+        import tomlkit
+
+        return tomlkit.dumps(doc)
+
+    # tomli_w does not support comments, so append the generator disclaimer as a
+    # trailing comment block. tomllib drops comments when parsing, so rewriting the
+    # same file never accumulates duplicates.
+    return tomli_w.dumps(doc) + textwrap.dedent(
+        f"""\
+
+        # Dependency lists in this file are generated by `{cli_name}`.
+        # To make changes, edit {relative_path_to_config_file} and run `{cli_name}`.
+        """
+    )
+
+
+def _update_pyproject_tomlkit(
+    doc,
+    *,
+    table_name: str,
+    key: str,
+    dependencies: typing.Sequence[typing.Union[str, dict[str, list[str]]]],
+    relative_path_to_config_file: str,
+) -> None:
+    """Update a dependency list in a ``tomlkit`` document, preserving its style.
+
+    This is the slower ``tomlkit``-based writer, kept for users who opt in to style
+    preservation via ``PRESERVE_TOML_STYLE_ENV_VAR``.
+    """
+    import tomlkit
+
+    # Bulk-extend the array and mark it multiline afterwards; add_line() does
+    # per-element trivia bookkeeping that is much slower for long lists.
+    toml_deps = tomlkit.array()
+    toml_deps.extend(dependencies)
+    toml_deps.multiline(True)
+    toml_deps.comment(
+        f"This list was generated by `{cli_name}`. To make changes, edit "
+        f"{relative_path_to_config_file} and run `{cli_name}`."
+    )
+
+    # Recursively descend into subtables like "[x.y.z]", creating tables as needed.
+    table = doc
+    for section in table_name.split("."):
+        try:
+            table = table[section]
+        except tomlkit.exceptions.NonExistentKey:
+            # If table is not a super-table (i.e. if it has its own contents and is
+            # not simply parted of a nested table name 'x.y.z') add a new line
+            # before adding a new sub-table.
+            if not table.is_super_table():
+                table.add(tomlkit.nl())
+            table[section] = tomlkit.table()
+            table = table[section]
+
+    table[key] = toml_deps
+
+
+def _write_if_changed(file_path: str, contents: str) -> None:
+    """Write ``contents`` to ``file_path`` unless the file already matches.
+
+    Leaving identical files untouched preserves their mtimes, so downstream build
+    tools do not see spurious changes.
+    """
+    try:
+        with open(file_path) as f:
+            if f.read() == contents:
+                return
+    except FileNotFoundError:
+        pass
+
+    with open(file_path, "w") as f:
+        f.write(contents)
 
 
 def get_filename(file_type: _config.Output, file_key: str, matrix_combo: dict[str, str]):
@@ -240,24 +412,37 @@ def get_filename(file_type: _config.Output, file_key: str, matrix_combo: dict[st
     str
         The name of the file to generate.
     """
-    file_type_prefix = ""
-    file_ext = ""
-    file_name_prefix = file_key
-    suffix = "_".join([f"{k}-{v}" for k, v in matrix_combo.items() if v])
-    if file_type == _config.Output.CONDA:
-        file_ext = ".yaml"
-    elif file_type == _config.Output.REQUIREMENTS:
-        file_ext = ".txt"
-        file_type_prefix = "requirements"
-    elif file_type == _config.Output.PYPROJECT:
-        file_ext = ".toml"
-        # Unlike for files like requirements.txt or conda environment YAML files, which
-        # may be named with additional prefixes (e.g. all_cuda_*) pyproject.toml files
-        # need to have that exact name and are never prefixed.
-        file_name_prefix = "pyproject"
-        suffix = ""
-    filename = "_".join(filter(None, (file_type_prefix, file_name_prefix, suffix))).replace(".", "")
-    return filename + file_ext
+    return _FILENAME_BUILDERS[file_type](file_key, matrix_combo)
+
+
+def _matrix_suffix(matrix_combo: dict[str, str]) -> str:
+    return "_".join(f"{k}-{v}" for k, v in matrix_combo.items() if v)
+
+
+def _filename_conda(file_key: str, matrix_combo: dict[str, str]) -> str:
+    suffix = _matrix_suffix(matrix_combo)
+    name = f"{file_key}_{suffix}" if suffix else file_key
+    return name.replace(".", "") + ".yaml"
+
+
+def _filename_requirements(file_key: str, matrix_combo: dict[str, str]) -> str:
+    suffix = _matrix_suffix(matrix_combo)
+    name = f"requirements_{file_key}_{suffix}" if suffix else f"requirements_{file_key}"
+    return name.replace(".", "") + ".txt"
+
+
+def _filename_pyproject(file_key: str, matrix_combo: dict[str, str]) -> str:
+    # Unlike for files like requirements.txt or conda environment YAML files, which
+    # may be named with additional prefixes (e.g. all_cuda_*) pyproject.toml files
+    # need to have that exact name and are never prefixed.
+    return "pyproject.toml"
+
+
+_FILENAME_BUILDERS = {
+    _config.Output.CONDA: _filename_conda,
+    _config.Output.REQUIREMENTS: _filename_requirements,
+    _config.Output.PYPROJECT: _filename_pyproject,
+}
 
 
 def get_output_dir(*, file_type: _config.Output, config_file_path: os.PathLike, file_config: _config.File):
@@ -292,6 +477,16 @@ def get_output_dir(*, file_type: _config.Output, config_file_path: os.PathLike,
     return os.path.join(*path)
 
 
+@functools.lru_cache(maxsize=None)
+def _glob_matcher(pattern: str) -> typing.Callable[[str], typing.Optional["re.Match[str]"]]:
+    """Compile an fnmatch-style glob pattern once and return its match function.
+
+    The same patterns are checked against every matrix combination, so caching the
+    compiled regex avoids re-translating and re-compiling the glob on each call.
+    """
+    return re.compile(fnmatch.translate(pattern)).match
+
+
 def should_use_specific_entry(matrix_combo: dict[str, str], specific_entry_matrix: dict[str, str]) -> bool:
     """Check if an entry should be used.
 
@@ -321,34 +516,39 @@ def should_use_specific_entry(matrix_combo: dict[str, str], specific_entry_matri
         True if the `specific_entry_matrix` is compatible with the current
         `matrix_combo` and False otherwise.
     """
-    return all(
-        matrix_combo.get(specific_key) and fnmatch.fnmatch(matrix_combo[specific_key], specific_value)
-        for specific_key, specific_value in specific_entry_matrix.items()
-    )
+    # Most non-matches are missing a required key entirely; reject those with a
+    # single C-level subset check before paying for any glob matching.
+    if not specific_entry_matrix.keys() <= matrix_combo.keys():
+        return False
+
+    for specific_key, specific_value in specific_entry_matrix.items():
+        value = matrix_combo[specific_key]
+        if not value or not _glob_matcher(specific_value)(value):
+            return False
+
+    return True
 
 
 @dataclass
 class _DependencyCollection:
     str_deps: set[str]
-    # e.g. {"pip": ["dgl", "pyg"]}, used in conda envs
-    dict_deps: dict[str, list[str]]
+    # e.g. {"pip": {"dgl", "pyg"}}, used in conda envs
+    dict_deps: dict[str, set[str]]
 
     def update(self, deps: typing.Sequence[typing.Union[str, dict[str, list[str]]]]) -> None:
         for dep in deps:
             if isinstance(dep, dict):
+                # deduplication happens here; sorting is deferred to deps_list so
+                # repeated updates don't re-sort the accumulated sets
                 for k, v in dep.items():
-                    if k in self.dict_deps:
-                        self.dict_deps[k].extend(v)
-                        self.dict_deps[k] = sorted(set(self.dict_deps[k]))
-                    else:
-                        self.dict_deps[k] = v
+                    self.dict_deps.setdefault(k, set()).update(v)
             else:
                 self.str_deps.add(dep)
 
     @property
     def deps_list(self) -> typing.Sequence[typing.Union[str, dict[str, list[str]]]]:
         if self.dict_deps:
-            return [*sorted(self.str_deps), self.dict_deps]
+            return [*sorted(self.str_deps), {k: sorted(v) for k, v in self.dict_deps.items()}]
 
         return [*sorted(self.str_deps)]
 
@@ -368,6 +568,9 @@ def make_dependency_files(
     `dependencies.yaml file spec <https://github.com/rapidsai/dependency-file-generator#dependenciesyaml-format>`_
     and produces the requested files.
 
+    When writing to the filesystem for several file keys, none of which produce
+    pyproject output, the file keys may be distributed across worker processes.
+
     Parameters
     ----------
     parsed_config : Config
@@ -399,6 +602,69 @@ def make_dependency_files(
             "when writing to stdout is not supported."
         )
 
+    # Each file key writes an independent set of files, so when writing to disk the
+    # keys can be processed in parallel. pyproject outputs are excluded because
+    # several file keys may update the same pyproject.toml, which is coordinated
+    # through a cache shared across keys; small runs stay serial since process
+    # startup would cost more than it saves.
+    if not to_stdout and len(file_keys) >= _MIN_PARALLEL_FILE_KEYS:
+        wants_pyproject = any(
+            _config.Output.PYPROJECT in (parsed_config.files[file_key].output if output is None else output)
+            for file_key in file_keys
+        )
+        if not wants_pyproject:
+            worker_state = {
+                "parsed_config": parsed_config,
+                "output": output,
+                "matrix": matrix,
+                "prepend_channels": prepend_channels,
+                "to_stdout": False,
+            }
+            with concurrent.futures.ProcessPoolExecutor(initializer=_init_worker, initargs=(worker_state,)) as executor:
+                # consume the iterator so worker exceptions propagate
+                list(executor.map(_process_file_key, file_keys))
+            return
+
+    _make_dependency_files_serial(
+        parsed_config=parsed_config,
+        file_keys=file_keys,
+        output=output,
+        matrix=matrix,
+        prepend_channels=prepend_channels,
+        to_stdout=to_stdout,
+    )
+
+
+_MIN_PARALLEL_FILE_KEYS = 4
+
+# per-process state for ProcessPoolExecutor workers, populated once by _init_worker
+# so the parsed config is not re-pickled for every file key
+_worker_state: dict[str, typing.Any] = {}
+
+
+def _init_worker(state: dict[str, typing.Any]) -> None:
+    _worker_state.update(state)
+
+
+def _process_file_key(file_key: str) -> None:
+    _make_dependency_files_serial(file_keys=[file_key], **_worker_state)
+
+
+def _make_dependency_files_serial(
+    *,
+    parsed_config: _config.Config,
+    file_keys: list[str],
+    output: typing.Union[set[_config.Output], None],
+    matrix: typing.Union[dict[str, list[str]], None],
+    prepend_channels: list[str],
+    to_stdout: bool,
+) -> None:
+    """Generate dependency files for the given file keys, in this process."""
+    # Resolve the TOML style-preservation flag once per run; consulting the
+    # environment at each use site could mix the two TOML backends if the
+    # environment changed mid-run.
+    preserve_toml_style = _preserve_toml_style_requested()
+
     # the list of conda channels does not depend on individual file keys
     conda_channels = prepend_channels + parsed_config.channels
 
@@ -406,6 +672,36 @@ def make_dependency_files(
     # passing multiple files keys and writing a merged result to stdout
     all_dependencies = _DependencyCollection(str_deps=set(), dict_deps={})
 
+    # parsed pyproject.toml documents, keyed by file path, so that several file keys
+    # targeting the same file only parse it once and write it once at the end
+    pyproject_docs: dict[str, typing.Any] = {}
+
+    # ids of specific-dependency entries whose matrices have already been checked for
+    # duplicates; the check depends only on the entry, not on the matrix combination
+    validated_specific_entries: set[int] = set()
+
+    # expanded (common packages, specific entries) per (include, file type), shared
+    # across file keys that pull in the same dependency sets
+    include_cache: dict[
+        tuple[str, _config.Output],
+        tuple[list[typing.Union[str, _config.PipRequirements]], list[_config.SpecificDependencies]],
+    ] = {}
+
+    # config-file paths relative to each output directory; output directories only
+    # take a handful of values across the run
+    relpath_cache: dict[str, str] = {}
+
+    # deduped dependency lists keyed by the order-insensitive content of their input
+    # (string deps plus sorted pip tuples); matrix combinations frequently produce
+    # identical dependency sets, which skips the re-sort in dedupe()
+    dedupe_cache: dict[
+        frozenset[typing.Union[str, tuple[str, ...]]],
+        typing.Sequence[typing.Union[str, dict[str, list[str]]]],
+    ] = {}
+
+    # output directories already known to exist, to avoid a stat/mkdir per written file
+    created_dirs: set[str] = set()
+
     for file_key in file_keys:
         file_config = parsed_config.files[file_key]
         file_types_to_generate = file_config.output if output is None else output
@@ -413,75 +709,131 @@ def make_dependency_files(
             file_matrix = matrix
         else:
             file_matrix = file_config.matrix
-        calculated_grid = list(grid(file_matrix))
+        calculated_grid = grid(file_matrix)
         if _config.Output.PYPROJECT in file_types_to_generate and len(calculated_grid) > 1:
             raise ValueError("Pyproject outputs can't have more than one matrix output")
         for file_type in file_types_to_generate:
-            for matrix_combo in calculated_grid:
-                dependencies = []
-
-                # Collect all includes from each dependency list corresponding
-                # to this (file_name, file_type, matrix_combo) tuple. The
-                # current tuple corresponds to a single file to be written.
-                for include in file_config.includes:
+            # The common packages and the output_types filters do not depend on the
+            # matrix combination, so expand each include once per file type (cached
+            # across file keys) instead of re-filtering per combo.
+            common_packages: list[typing.Union[str, _config.PipRequirements]] = []
+            specific_entries: list[tuple[str, _config.SpecificDependencies]] = []
+            for include in file_config.includes:
+                try:
+                    include_common, include_specific = include_cache[(include, file_type)]
+                except KeyError:
                     dependency_entry = parsed_config.dependencies[include]
 
-                    for common_entry in dependency_entry.common:
-                        if file_type not in common_entry.output_types:
-                            continue
-                        dependencies.extend(common_entry.packages)
+                    include_common = [
+                        package
+                        for common_entry in dependency_entry.common
+                        if file_type in common_entry.output_types
+                        for package in common_entry.packages
+                    ]
 
+                    include_specific = []
                     for specific_entry in dependency_entry.specific:
                         if file_type not in specific_entry.output_types:
                             continue
 
-                        # Ensure that all specific matrices are unique
-                        num_matrices = len(specific_entry.matrices)
-                        num_unique = len(
-                            {
-                                frozenset(specific_matrices_entry.matrix.items())
-                                for specific_matrices_entry in specific_entry.matrices
-                            }
-                        )
-                        if num_matrices != num_unique:
-                            err = f"All matrix entries must be unique. Found duplicates in '{include}':"
-                            for specific_matrices_entry in specific_entry.matrices:
-                                err += f"\n - {specific_matrices_entry.matrix}"
-                            raise ValueError(err)
-
-                        fallback_entry = None
-                        for specific_matrices_entry in specific_entry.matrices:
-                            # An empty `specific_matrices_entry["matrix"]` is
-                            # valid and can be used to specify a fallback_entry for a
-                            # `matrix_combo` for which no specific entry
-                            # exists. In that case we save the fallback_entry result
-                            # and only use it at the end if nothing more
-                            # specific is found.
-                            if not specific_matrices_entry.matrix:
-                                fallback_entry = specific_matrices_entry
-                                continue
-
-                            if should_use_specific_entry(matrix_combo, specific_matrices_entry.matrix):
-                                # A package list may be empty as a way to
-                                # indicate that for some matrix elements no
-                                # packages should be installed.
-                                dependencies.extend(specific_matrices_entry.packages or [])
-                                break
+                        # Ensure that all specific matrices are unique (once per entry)
+                        if id(specific_entry) not in validated_specific_entries:
+                            num_matrices = len(specific_entry.matrices)
+                            num_unique = len(
+                                {
+                                    frozenset(specific_matrices_entry.matrix.items())
+                                    for specific_matrices_entry in specific_entry.matrices
+                                }
+                            )
+                            if num_matrices != num_unique:
+                                err = f"All matrix entries must be unique. Found duplicates in '{include}':"
+                                for specific_matrices_entry in specific_entry.matrices:
+                                    err += f"\n - {specific_matrices_entry.matrix}"
+                                raise ValueError(err)
+                            validated_specific_entries.add(id(specific_entry))
+
+                        include_specific.append(specific_entry)
+
+                    include_cache[(include, file_type)] = (include_common, include_specific)
+
+                common_packages.extend(include_common)
+                specific_entries.extend((include, specific_entry) for specific_entry in include_specific)
+
+            # The output directory and the config-file relative path are fixed for
+            # this (file_key, file_type); os.path.relpath in particular is too
+            # expensive to recompute per matrix combination.
+            output_dir = get_output_dir(
+                file_type=file_type,
+                config_file_path=parsed_config.path,
+                file_config=file_config,
+            )
+            relative_path_to_config_file = relpath_cache.get(output_dir)
+            if relative_path_to_config_file is None:
+                relative_path_to_config_file = relpath_cache[output_dir] = os.path.relpath(
+                    parsed_config.path, output_dir
+                )
+
+            for matrix_combo in calculated_grid:
+                # Collect the package lists from each dependency list corresponding
+                # to this (file_name, file_type, matrix_combo) tuple and flatten
+                # them in one pass at the end. The current tuple corresponds to a
+                # single file to be written.
+                package_lists = [common_packages]
+
+                for include, specific_entry in specific_entries:
+                    fallback_entry = None
+                    for specific_matrices_entry in specific_entry.matrices:
+                        # An empty `specific_matrices_entry["matrix"]` is
+                        # valid and can be used to specify a fallback_entry for a
+                        # `matrix_combo` for which no specific entry
+                        # exists. In that case we save the fallback_entry result
+                        # and only use it at the end if nothing more
+                        # specific is found.
+                        if not specific_matrices_entry.matrix:
+                            fallback_entry = specific_matrices_entry
+                            continue
+
+                        if should_use_specific_entry(matrix_combo, specific_matrices_entry.matrix):
+                            # A package list may be empty as a way to
+                            # indicate that for some matrix elements no
+                            # packages should be installed.
+                            if specific_matrices_entry.packages:
+                                package_lists.append(specific_matrices_entry.packages)
+                            break
+                    else:
+                        if fallback_entry:
+                            package_lists.append(fallback_entry.packages)
                         else:
-                            if fallback_entry:
-                                dependencies.extend(fallback_entry.packages)
-                            else:
-                                raise ValueError(f"No matching matrix found in '{include}' for: {matrix_combo}")
+                            raise ValueError(f"No matching matrix found in '{include}' for: {matrix_combo}")
+
+                dependencies = list(itertools.chain.from_iterable(package_lists))
 
                 # Dedupe deps and print / write to filesystem
                 full_file_name = get_filename(file_type, file_key, matrix_combo)
-                deduped_deps = dedupe(dependencies)
+                dedupe_key = frozenset(dep if isinstance(dep, str) else tuple(sorted(dep.pip)) for dep in dependencies)
+                deduped_deps = dedupe_cache.get(dedupe_key)
+                if deduped_deps is None:
+                    deduped_deps = dedupe_cache[dedupe_key] = dedupe(dependencies)
+
+                if not to_stdout and file_type == _config.Output.PYPROJECT:
+                    # Mutate the cached document instead of reading and rewriting the
+                    # file on every iteration; it is serialized once at the end.
+                    table_name, key = _pyproject_table_key(file_config.extras)
+                    file_path = os.path.join(output_dir, full_file_name)
+                    try:
+                        doc = pyproject_docs[file_path]
+                    except KeyError:
+                        doc = pyproject_docs[file_path] = _load_pyproject(file_path, preserve_style=preserve_toml_style)
+                    _update_pyproject(
+                        doc,
+                        table_name=table_name,
+                        key=key,
+                        dependencies=deduped_deps,
+                        relative_path_to_config_file=relative_path_to_config_file,
+                        preserve_style=preserve_toml_style,
+                    )
+                    continue
 
-                output_dir = get_output_dir(
-                    file_type=file_type,
-                    config_file_path=parsed_config.path,
-                    file_config=file_config,
-                )
                 contents = make_dependency_file(
                     file_type=file_type,
                     conda_env_name=os.path.splitext(full_file_name)[0],
@@ -491,6 +843,7 @@ def make_dependency_files(
                     conda_channels=conda_channels,
                     dependencies=deduped_deps,
                     extras=file_config.extras,
+                    relative_path_to_config_file=relative_path_to_config_file,
                 )
 
                 if to_stdout:
@@ -499,10 +852,19 @@ def make_dependency_files(
                     else:
                         all_dependencies.update(deduped_deps)
                 else:
-                    os.makedirs(output_dir, exist_ok=True)
-                    file_path = os.path.join(output_dir, full_file_name)
-                    with open(file_path, "w") as f:
-                        f.write(contents)
+                    if output_dir not in created_dirs:
+                        os.makedirs(output_dir, exist_ok=True)
+                        created_dirs.add(output_dir)
+                    _write_if_changed(os.path.join(output_dir, full_file_name), contents)
+
+    # serialize and write each modified pyproject.toml exactly once
+    for file_path, doc in pyproject_docs.items():
+        contents = _dump_pyproject(
+            doc,
+            relative_path_to_config_file=os.path.relpath(parsed_config.path, os.path.dirname(file_path)),
+            preserve_style=preserve_toml_style,
+        )
+        _write_if_changed(file_path, contents)
 
     # create one unified output from all the file_keys, and print it to stdout
     if to_stdout and len(file_keys) > 1:
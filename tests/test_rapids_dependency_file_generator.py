@@ -1,12 +1,14 @@
 from unittest import mock
 
 import yaml
+import textwrap
 import tomlkit
 import pathlib
 import pytest
 import re
 
 from rapids_dependency_file_generator import _config
+from rapids_dependency_file_generator import _rapids_dependency_file_generator
 from rapids_dependency_file_generator._constants import cli_name
 from rapids_dependency_file_generator._rapids_dependency_file_generator import (
     dedupe,
@@ -203,6 +205,149 @@ def test_make_dependency_files_conda_to_stdout_with_multiple_file_keys_works(cap
     ]
 
 
+def _generate_files_into(config_dir):
+    config_dir.mkdir(parents=True, exist_ok=True)
+    config_path = config_dir / "dependencies.yaml"
+    config_path.write_text(
+        textwrap.dedent(
+            """\
+            files:
+              build:
+                output: [conda, requirements]
+                includes: [run]
+                matrix:
+                  cuda: ["11.5", "11.6"]
+              test:
+                output: [conda]
+                includes: [run, test_deps]
+              docs:
+                output: [requirements]
+                includes: [run]
+              checks:
+                output: [conda]
+                includes: [test_deps]
+            channels: [rapidsai]
+            dependencies:
+              run:
+                common:
+                  - output_types: [conda, requirements]
+                    packages: [numpy, pandas]
+                specific:
+                  - output_types: [conda, requirements]
+                    matrices:
+                      - matrix: {cuda: "11.5"}
+                        packages: [cudatoolkit=11.5]
+                      - matrix: null
+                        packages: [cudatoolkit]
+              test_deps:
+                common:
+                  - output_types: [conda]
+                    packages: [pytest]
+            """
+        )
+    )
+    parsed_config = _config.load_config_from_file(config_path)
+    make_dependency_files(
+        parsed_config=parsed_config,
+        file_keys=list(parsed_config.files.keys()),
+        output=None,
+        matrix=None,
+        prepend_channels=[],
+        to_stdout=False,
+    )
+    return {
+        str(path.relative_to(config_dir)): path.read_text()
+        for path in config_dir.rglob("*")
+        if path.is_file() and path.name != "dependencies.yaml"
+    }
+
+
+def test_make_dependency_files_parallel_matches_serial(tmp_path, monkeypatch):
+    # force the serial path despite there being enough file keys to parallelize
+    monkeypatch.setattr(_rapids_dependency_file_generator, "_MIN_PARALLEL_FILE_KEYS", 100)
+    serial_files = _generate_files_into(tmp_path / "serial")
+
+    # force the process-pool path
+    monkeypatch.setattr(_rapids_dependency_file_generator, "_MIN_PARALLEL_FILE_KEYS", 1)
+    parallel_files = _generate_files_into(tmp_path / "parallel")
+
+    assert len(serial_files) > 0
+    assert parallel_files == serial_files
+
+
+def test_make_dependency_files_skips_rewriting_unchanged_files(tmp_path):
+    _generate_files_into(tmp_path)
+    generated = [path for path in tmp_path.rglob("*") if path.is_file() and path.name != "dependencies.yaml"]
+    assert generated
+    mtimes = {path: path.stat().st_mtime_ns for path in generated}
+
+    # a second identical run must leave every file untouched, mtimes included
+    _generate_files_into(tmp_path)
+    assert {path: path.stat().st_mtime_ns for path in generated} == mtimes
+
+
+def test_make_dependency_files_preserve_toml_style_env_var(tmp_path, monkeypatch):
+    monkeypatch.setenv(_rapids_dependency_file_generator.PRESERVE_TOML_STYLE_ENV_VAR, "1")
+
+    (tmp_path / "dependencies.yaml").write_text(
+        textwrap.dedent(
+            """\
+            files:
+              py_build:
+                output: pyproject
+                includes: [run]
+                pyproject_dir: .
+                extras:
+                  table: project
+            channels: [rapidsai]
+            dependencies:
+              run:
+                common:
+                  - output_types: [pyproject]
+                    packages: [numpy, pandas]
+            """
+        )
+    )
+    (tmp_path / "pyproject.toml").write_text(
+        textwrap.dedent(
+            """\
+            # a hand-written comment that style preservation must keep
+            [project]
+            name = "test-pkg"
+            version = "1.2.3"
+            dependencies = ["old-dep"]
+            """
+        )
+    )
+
+    parsed_config = _config.load_config_from_file(tmp_path / "dependencies.yaml")
+    make_dependency_files(
+        parsed_config=parsed_config,
+        file_keys=["py_build"],
+        output=None,
+        matrix=None,
+        prepend_channels=[],
+        to_stdout=False,
+    )
+
+    contents = (tmp_path / "pyproject.toml").read_text()
+
+    # the tomlkit writer preserves untouched content, including comments
+    assert "# a hand-written comment that style preservation must keep" in contents
+
+    doc = tomlkit.loads(contents)
+    assert doc["project"]["name"] == "test-pkg"
+    assert list(doc["project"]["dependencies"]) == ["numpy", "pandas"]
+
+    # the bulk-built tomlkit array renders one dependency per line, with the
+    # generator disclaimer as an inline comment on the closing bracket
+    assert 'dependencies = [\n    "numpy",\n    "pandas",\n]' in contents
+    assert (
+        f"] # This list was generated by `{cli_name}`. To make changes, "
+        f"edit dependencies.yaml and run `{cli_name}`." in contents
+    )
+
+
 def test_should_use_specific_entry():
     # no match
     matrix_combo = {"cuda": "11.5", "arch": "x86_64"}